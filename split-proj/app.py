@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify, send_file, Response, stream_with_context, make_response, send_from_directory
+from flask import Flask, request, jsonify, Response, stream_with_context, send_from_directory
 from flask_cors import CORS
 import pandas as pd
 import io
@@ -7,25 +7,31 @@ from datetime import datetime
 import zipfile
 import os
 import logging
-from collections import Counter
+from collections import Counter, defaultdict
 import werkzeug
 from werkzeug.serving import make_server
+from werkzeug.http import dump_options_header
 from werkzeug.middleware.proxy_fix import ProxyFix
 import signal
 import sys
-import threading
-import queue
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
 import json
 import uuid
 from io import BytesIO
 import csv
-import tempfile
-import shutil
 import traceback
+import functools
+import orjson
 import socket
+import threading
+import time
+import unicodedata
+from urllib.parse import quote
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+# Configure logging, per-line debug records are expensive on large files so DEBUG is opt-in via LOG_LEVEL
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO').upper())
 logger = logging.getLogger(__name__)
 
 # Get the absolute path to the project root directory
@@ -45,16 +51,28 @@ app.config['MAX_CONTENT_LENGTH'] = 1024 * 1024 * 1024  # 1GB in bytes
 app.config['PERMANENT_SESSION_LIFETIME'] = 1800  # 30 minutes
 app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 1800  # 30 minutes
 
-# Disable signal handling that might cause abortions
-signal.signal(signal.SIGINT, signal.SIG_DFL)
-signal.signal(signal.SIGTERM, signal.SIG_DFL)
+# Worker processes for parsing uploaded files, which is CPU-bound. Workers are started from a
+# forkserver (spawn where unavailable), forking this multithreaded server could copy a held lock
+PROCESSING_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+
+def new_processing_pool():
+    """Create the worker pool for parsing uploaded files"""
+    return ProcessPoolExecutor(max_workers=os.cpu_count(),
+                               mp_context=multiprocessing.get_context(PROCESSING_START_METHOD))
+
 
-# Create a queue for processing results
-processing_queue = queue.Queue()
+processing_pool = new_processing_pool()
 
-# Store processing status and results
+# Store processing status and results, guarded by processing_lock since the
+# worker pool's callbacks write them from another thread
 processing_status = {}
 processing_results = {}
+processing_finished_at = {}  # processing_id -> time.monotonic() when the job finished
+processing_lock = threading.Lock()
+
+# Finished jobs are forgotten after this long, the client fetches them within seconds
+PROCESSING_RESULT_TTL = 60 * 60  # 1 hour
 
 # Define payment modes and their variations
 PAYMENT_MODES = [
@@ -116,6 +134,96 @@ PAYMENT_MODES = [
 ]
 
 
+def compile_alternation(words):
+    """Compile a list of literal words into a single uppercase alternation pattern"""
+    # Longest words first so overlapping variations prefer the most specific one
+    words = sorted({word.upper() for word in words}, key=len, reverse=True)
+    return re.compile('|'.join(re.escape(word) for word in words))
+
+
+# Filename keywords per payment mode, checked in order
+FILENAME_MODE_PATTERNS = [
+    ('ECPAY', compile_alternation(['ECPAY'])),
+    ('BDO', compile_alternation(['BDO'])),
+    ('CEBUANA', compile_alternation(['CEBUANA'])),
+    ('PERALINK', compile_alternation(['PERALINK'])),
+    ('CHINABANK', compile_alternation(['CHINABANK', 'CHINA BANK'])),
+    ('CIS', compile_alternation(['CIS'])),
+    ('METROBANK', compile_alternation(['METROBANK', 'METRO BANK'])),
+    ('PNB', compile_alternation(['PNB'])),
+    ('UNIONBANK', compile_alternation(['UB', 'UNIONBANK'])),
+    ('SM', compile_alternation(['SM']))
+]
+
+
+# Encodings tried in order for uploaded files, iso-8859-1 accepts any byte sequence
+UPLOAD_ENCODINGS = ['utf-8', 'cp1252', 'iso-8859-1']
+
+# Translation table deleting every non-digit ASCII character
+NON_DIGIT_ASCII_TABLE = str.maketrans('', '', ''.join(chr(c) for c in range(128) if not chr(c).isdigit()))
+
+# Line patterns for the fixed-width bank formats. The lookbehinds only let a match start at the
+# beginning of a digit or whitespace run, so a failed run is not retried from every position in it
+ATM_REF_PATTERN = re.compile(r'\d{14}')
+METROBANK_AMOUNT_PATTERN = re.compile(r'(\d{11,12})[A-Z]')
+METROBANK_DATE_PATTERN = re.compile(r'(?<!\d)(\d{6})\d*$')
+# METROBANK amount and, when the line ends in a run of 6+ digits after it, the date in one scan
+METROBANK_LINE_PATTERN = re.compile(r'(\d{11,12})[A-Z](?:.*(?<!\d)(\d{6})\d*$)?')
+SM_AMOUNT_DIGITS_PATTERN = re.compile(r'\d+\Z')
+UNIONBANK_DATE_PATTERN = re.compile(r'UB\d+\s+(\d{6})')
+UNIONBANK_ATM_REF_PATTERN = re.compile(r'(?<!\s)\s{10,}(\d{14})\s+')
+UNIONBANK_SHORT_ATM_REF_PATTERN = re.compile(r'(?<!\s)\s{10,}(\d{4,})\s+')
+
+# Field index of the ATM reference for the delimited payment modes
+ATM_REF_FIELD_INDEX = {
+    'PNB': 4,
+    'BDO': 5,
+    'ECPAY': 5,
+    'CIS': 1,
+    'CHINABANK': 3,
+    'CEBUANA': 4
+}
+
+# Amount field of each delimited payment mode's lines as (index, may contain thousands separators)
+LINE_AMOUNT_FIELDS = {
+    'PNB': (6, True),
+    'BDO': (9, False),
+    'ECPAY': (6, True),
+    'CHINABANK': (2, True),
+    'CEBUANA': (6, True),
+    'CIS': (2, True)
+}
+
+# Field separator the frontend uses to display each payment mode's raw lines (',' otherwise)
+DISPLAY_SEPARATORS = {
+    'PNB': '^',
+    'BDO': '|',
+    'METROBANK': ' ',
+    'CHINABANK': ' '
+}
+
+# Date fields recorded per delimited payment mode as (index, label, is MMDDYYYY)
+# Unlabelled dates are recorded as-is, labelled ones only when present
+LINE_DATE_FIELDS = {
+    'PNB': [(1, None, False)],
+    'BDO': [(2, None, False)],
+    'ECPAY': [(2, 'ECPAY', False)],
+    'CHINABANK': [(0, 'CHINABANK', True)],
+    'CEBUANA': [(1, 'Date1', False), (2, 'Date2', False)],
+    'CIS': [(0, None, False)]
+}
+
+# Report date fields per payment mode as (index, label, is MMDDYYYY)
+REPORT_DATE_FIELDS = {
+    'BDO': [(2, 'BDO', False)],
+    'CEBUANA': [(1, 'CEBUANA Date1', False), (2, 'CEBUANA Date2', False)],
+    'PNB': [(1, 'PNB', False)],
+    'CIS': [(0, 'CIS', True)],
+    'ECPAY': [(2, 'ECPAY', False)],
+    'CHINABANK': [(0, 'CHINABANK', True)]
+}
+
+
 def detect_payment_mode(row):
     """Detect payment mode from a row of data"""
     # First, check the Name & Remarks field (first column)
@@ -343,146 +451,135 @@ def parse_fixed_width_line(line):
     return []
 
 
+# The splitters take maxsplit like str.split, so callers that read only the leading
+# fields can leave the rest of the line in one unsplit field
+def split_pipe_fields(line, maxsplit=-1):
+    """Split a BDO line into its pipe separated fields"""
+    return line.strip().split('|', maxsplit)
+
+
+def split_whitespace_fields(line, maxsplit=-1):
+    """Split a CHINABANK line into its whitespace separated fields"""
+    # str.split() skips leading whitespace and never yields empty fields, only the unsplit
+    # remainder left by maxsplit can keep trailing whitespace
+    fields = line.split(None, maxsplit)
+    if 0 <= maxsplit < len(fields):
+        fields[-1] = fields[-1].rstrip()
+    return fields
+
+
+def split_caret_fields(line, maxsplit=-1):
+    """Split a CIS or PNB line into its caret separated, stripped fields"""
+    return [f.strip() for f in line.split('^', maxsplit)]
+
+
+def split_comma_fields(line, maxsplit=-1):
+    """Split a comma separated line into its stripped fields"""
+    return [f.strip() for f in line.split(',', maxsplit)]
+
+
+# Field splitter per payment mode, comma separated for any mode not listed
+LINE_FIELD_SPLITTERS = {
+    'BDO': split_pipe_fields,
+    'CHINABANK': split_whitespace_fields,
+    'CIS': split_caret_fields,
+    'PNB': split_caret_fields
+}
+
+# Number of splits needed to reach the last field read from each delimited payment mode's lines
+LINE_MAXSPLIT = {
+    'PNB': 7,
+    'BDO': 10,
+    'ECPAY': 7,
+    'CHINABANK': 4,
+    'CEBUANA': 7,
+    'CIS': 3
+}
+
+
+# ATM reference fields repeat across the lines of a statement, so cache their cleaned values
+@functools.lru_cache(maxsize=65536)
+def keep_digits(text):
+    """Return only the digit characters of text"""
+    # ASCII text takes the C-level translate path; anything else keeps the full isdigit() semantics
+    if text.isascii():
+        return text.translate(NON_DIGIT_ASCII_TABLE)
+    return ''.join(c for c in text if c.isdigit())
+
+
 def detect_atm_reference_by_payment_mode(fields, payment_mode, original_line):
     """
     Detect ATM reference based on the payment mode
     """
     try:
-        if payment_mode == 'METROBANK':
-            # For METROBANK, split by spaces and get index 1
-            fields = [f.strip() for f in original_line.split() if f.strip()]
-            if len(fields) > 1:
-                atm_ref = fields[1].strip()
-                logger.debug(f"Found METROBANK ATM ref: {atm_ref} from field: {fields[1]}")
-                return atm_ref
-            return None
-
-        elif payment_mode == 'PNB':
-            # For PNB, ATM ref is in field 5 (index 4)
-            if len(fields) > 4:
-                atm_ref_field = fields[4].strip()
-                logger.debug(f"PNB ATM ref field: {atm_ref_field}")
-
-                # Clean the reference (keep only digits)
-                clean_ref = ''.join(c for c in atm_ref_field if c.isdigit())
-
-                # Take first 4 digits as ATM ref
-                if len(clean_ref) >= 4:
-                    atm_ref = clean_ref[:4]
-                    logger.debug(f"Found PNB ATM ref: {atm_ref} from {atm_ref_field}")
-                    return atm_ref
-            return None
-
-        elif payment_mode == 'BDO':
-            # For BDO, ATM ref is in field 6 (index 5)
-            if len(fields) > 5:
-                atm_ref_field = fields[5].strip()
+        field_index = ATM_REF_FIELD_INDEX.get(payment_mode)
+        if field_index is not None:
+            if len(fields) > field_index:
+                atm_ref_field = fields[field_index].strip()
                 # Clean the reference (keep only digits)
-                clean_ref = ''.join(c for c in atm_ref_field if c.isdigit())
+                clean_ref = keep_digits(atm_ref_field)
                 # Take first 4 digits as ATM ref
                 if len(clean_ref) >= 4:
                     atm_ref = clean_ref[:4]
-                    logger.debug(f"Found BDO ATM ref: {atm_ref} from {atm_ref_field}")
+                    logger.debug("Found %s ATM ref: %s from %s", payment_mode, atm_ref, atm_ref_field)
                     return atm_ref
             return None
 
-        elif payment_mode == 'ECPAY':
-            # For ECPAY, ATM ref is in field 6 (index 5)
-            if len(fields) > 5:
-                atm_ref_field = fields[5].strip()
-                # Clean the reference (keep only digits)
-                clean_ref = ''.join(c for c in atm_ref_field if c.isdigit())
-                # Take first 4 digits as ATM ref
-                if len(clean_ref) >= 4:
-                    atm_ref = clean_ref[:4]
-                    logger.debug(f"Found ECPAY ATM ref: {atm_ref} from {atm_ref_field}")
-                    return atm_ref
+        if payment_mode == 'METROBANK':
+            # For METROBANK, split by spaces and get index 1
+            fields = original_line.split()
+            if len(fields) > 1:
+                atm_ref = fields[1].strip()
+                logger.debug("Found METROBANK ATM ref: %s from field: %s", atm_ref, fields[1])
+                return atm_ref
             return None
 
-        elif payment_mode == 'UNIONBANK':
+        if payment_mode == 'UNIONBANK':
             # For UNIONBANK, ATM ref is at the end of the line
             # Find the last sequence of 14 digits in the line
-            matches = re.findall(r'\d{14}', original_line)
+            matches = ATM_REF_PATTERN.findall(original_line)
             if matches:
                 atm_ref_field = matches[-1]  # Take the last match
                 # Take first 4 digits as ATM ref
                 atm_ref = atm_ref_field[:4]
-                logger.debug(f"Found UNIONBANK ATM ref: {atm_ref} from {atm_ref_field}")
+                logger.debug("Found UNIONBANK ATM ref: %s from %s", atm_ref, atm_ref_field)
                 return atm_ref
             return None
 
-        elif payment_mode == 'CIS':
-            # For CIS, ATM ref is in field 2 (index 1)
-            if len(fields) > 1:
-                atm_ref_field = fields[1].strip()
-                # Clean the reference (keep only digits)
-                clean_ref = ''.join(c for c in atm_ref_field if c.isdigit())
-                # Take first 4 digits as ATM ref
-                if len(clean_ref) >= 4:
-                    atm_ref = clean_ref[:4]
-                    logger.debug(f"Found CIS ATM ref: {atm_ref} from {atm_ref_field}")
-                    return atm_ref
-            return None
-
-        elif payment_mode == 'CHINABANK':
-            # For CHINABANK, ATM ref is in field 4 (index 3)
-            if len(fields) > 3:
-                atm_ref_field = fields[3].strip()
-                # Clean the reference (keep only digits)
-                clean_ref = ''.join(c for c in atm_ref_field if c.isdigit())
-                # Take first 4 digits as ATM ref
-                if len(clean_ref) >= 4:
-                    atm_ref = clean_ref[:4]
-                    logger.debug(f"Found CHINABANK ATM ref: {atm_ref} from {atm_ref_field}")
-                    return atm_ref
-            return None
-
-        elif payment_mode == 'CEBUANA':
-            # For CEBUANA, ATM ref is in field 5 (index 4)
-            if len(fields) > 4:
-                atm_ref_field = fields[4].strip()
-                # Clean the reference (keep only digits)
-                clean_ref = ''.join(c for c in atm_ref_field if c.isdigit())
-                # Take first 4 digits as ATM ref
-                if len(clean_ref) >= 4:
-                    atm_ref = clean_ref[:4]
-                    logger.debug(f"Found CEBUANA ATM ref: {atm_ref} from {atm_ref_field}")
-                    return atm_ref
-            return None
-
         return None
 
     except Exception as e:
-        logger.error(f"Error detecting ATM reference: {str(e)}")
-        logger.error(f"Traceback:\n{traceback.format_exc()}")
+        # Called for every line, so log one record and let the handler format the traceback
+        logger.exception("Error detecting ATM reference: %s", e)
         return None
 
 
+def atm_group_factory(payment_mode):
+    """Return a factory for the empty ATM reference groups of a payment mode's file"""
+    def new_atm_group():
+        group = {
+            'raw_contents': [],
+            'transaction_count': 0,
+            'total_amount': 0.0,
+            'payment_mode': payment_mode,
+            'dates': set()
+        }
+        if payment_mode == 'SM':
+            group['atm_refs'] = set()  # Store all ATM refs for this group
+        if payment_mode in ('METROBANK', 'SM'):
+            group['amounts'] = []  # Amount per line, reused by the status endpoint
+        return group
+    return new_atm_group
+
+
 def detect_payment_mode_from_filename(filename):
     """Detect payment mode from filename"""
     # Convert filename to uppercase for case-insensitive comparison
     filename_upper = filename.upper()
 
-    if 'ECPAY' in filename_upper:
-        return 'ECPAY'
-    elif 'BDO' in filename_upper:
-        return 'BDO'
-    elif 'CEBUANA' in filename_upper:
-        return 'CEBUANA'
-    elif 'PERALINK' in filename_upper:
-        return 'PERALINK'
-    elif 'CHINABANK' in filename_upper or 'CHINA BANK' in filename_upper:
-        return 'CHINABANK'
-    elif 'CIS' in filename_upper:
-        return 'CIS'
-    elif 'METROBANK' in filename_upper or 'METRO BANK' in filename_upper:
-        return 'METROBANK'
-    elif 'PNB' in filename_upper:
-        return 'PNB'
-    elif 'UB' in filename_upper or 'UNIONBANK' in filename_upper:
-        return 'UNIONBANK'
-    elif 'SM' in filename_upper:
-        return 'SM'
+    for name, pattern in FILENAME_MODE_PATTERNS:
+        if pattern.search(filename_upper):
+            return name
 
     return 'Unknown'
 
@@ -526,113 +623,90 @@ def extract_amount(fields, payment_mode):
         return 0.0
 
 
-@app.route('/api/generate-report', methods=['POST'])
-def generate_report():
-    try:
-        app.logger.info("Starting report generation")
-        data = request.get_json()
+# Statement lines share a handful of dates, so each distinct date is formatted once
+@functools.lru_cache(maxsize=4096)
+def format_slash_date(date_str):
+    """Format an MMDDYY or MMDDYYYY date string as MM/DD/YY or MM/DD/YYYY"""
+    return '%s/%s/%s' % (date_str[:2], date_str[2:4], date_str[4:])
 
-        if not data or not isinstance(data, dict):
-            raise ValueError("Invalid data format received")
 
-        processed_data = data.get('processed_data', {})
-        raw_contents = data.get('raw_contents', [])
-        original_filename = data.get('original_filename', 'transactions')
+def find_sm_amount_offsets(line, cs_pos):
+    """Return the start and end offsets of the SM amount digits right before 'CS'"""
+    # Match the run of digits ending at 'CS' within the 9 characters before it, in C
+    match = SM_AMOUNT_DIGITS_PATTERN.search(line, max(0, cs_pos - 10) + 1, cs_pos)
+    if match:
+        return match.start(), cs_pos
+    return cs_pos, cs_pos
 
-        # Create a temporary directory for the files
-        temp_dir = tempfile.mkdtemp()
 
-        try:
+def find_unionbank_amount_digits(line):
+    """Return the 12 amount digits before a UNIONBANK line's trailing DB/LC marker, or None"""
+    # The amount is anchored at the end of the line, so scan back from there instead of searching
+    # the whole line: optional trailing whitespace and digits, the marker, then the 12 digits
+    end = len(line.rstrip())
+    while end and line[end - 1].isdecimal():
+        end -= 1
+    if end < 14 or line[end - 2:end] not in ('DB', 'LC'):
+        return None
+    digits = line[end - 14:end - 2]
+    return digits if digits.isdecimal() else None
+
+
+def find_unionbank_atm_ref(line):
+    """Return the first 4 digits of a UNIONBANK line's ATM reference ('0000' if none) and its fallback fields"""
+    # Prefer the last 14-digit reference in the line, findall collects the matches in C
+    matches = UNIONBANK_ATM_REF_PATTERN.findall(line)
+    if matches:
+        return matches[-1][:4], None
+
+    # Otherwise take any sequence of at least 4 digits that could be an ATM reference
+    ref_match = UNIONBANK_SHORT_ATM_REF_PATTERN.search(line)
+    if ref_match:
+        return ref_match.group(1)[:4], None
+
+    # If still no reference found, try to get it from index 4 of the whitespace-split fields
+    fields = line.strip().split()
+    if len(fields) > 4:
+        clean_ref = keep_digits(fields[4])[:4]
+        if len(clean_ref) >= 4:
+            return clean_ref, fields
+    return '0000', fields
+
+
+class ZipChunkWriter(io.RawIOBase):
+    """Write-only, unseekable sink that collects zip output until it is drained"""
+
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        """Return and forget everything written since the last drain"""
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_report_zip(processed_data, total_transactions, total_amount, breakdown_rows):
+    """Yield the report zip archive chunk by chunk, one chunk per file in it"""
+    sink = ZipChunkWriter()
+    try:
+        # Fastest DEFLATE level, the repetitive transaction lines still compress several times over
+        with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=1) as zipf:
             # Create CSV summary file
-            csv_file_path = os.path.join(temp_dir, 'transactions_summary.csv')
-            with open(csv_file_path, 'w', newline='', encoding='utf-8-sig') as csvfile:
+            with io.TextIOWrapper(zipf.open('transactions_summary.csv', 'w'),
+                                  encoding='utf-8-sig', newline='') as csvfile:
                 writer = csv.writer(csvfile)
                 writer.writerow(['OVERALL SUMMARY REPORT'])
                 writer.writerow([])
 
-                # Calculate totals
-                total_transactions = 0
-                total_amount = 0.0
-
-                # Process transactions
-                for atm_ref, transactions in processed_data.items():
-                    if not isinstance(transactions, list):
-                        continue
-
-                    total_transactions += len(transactions)
-                    for trans in transactions:
-                        if isinstance(trans, dict):
-                            payment_mode = trans.get('payment_mode', '')
-                            original_line = trans.get('original_line', '')
-
-                            if payment_mode == 'METROBANK' and original_line:
-                                # For METROBANK, extract amount from the line
-                                amount_match = re.search(r'(\d{11,12})[A-Z]', original_line)
-                                if amount_match:
-                                    amount_str = amount_match.group(1)
-                                    amount = float(amount_str) / 100
-                                    total_amount += amount
-                                    logger.debug(f"Adding METROBANK amount to total: {amount}")
-                            elif payment_mode == 'SM' and original_line:
-                                # Initialize group_total and dates for SM transactions
-                                if 'group_total' not in locals():
-                                    group_total = 0.0
-                                if 'dates' not in locals():
-                                    dates = set()
-                                    
-                                # For SM, extract amount from the line
-                                cs_pos = original_line.find('CS')
-                                if cs_pos > 0:
-                                    # Look backwards from CS to find the amount
-                                    amount_str = ''
-                                    for i in range(cs_pos - 1, max(0, cs_pos - 10), -1):
-                                        if original_line[i].isdigit():
-                                            amount_str = original_line[i] + amount_str
-                                        else:
-                                            break
-                                    
-                                    if amount_str:
-                                        amount = float(amount_str) / 100
-                                        group_total += amount
-                                        total_amount += amount  # Add to total_amount as well
-                                        logger.debug(f"Found SM amount for ATM {atm_ref}: {amount} from {amount_str}")
-
-                                # Extract date from positions 3-11 (MMDDYYYY format)
-                                if len(original_line) >= 11:
-                                    date_str = original_line[3:11]
-                                    if date_str:
-                                        formatted_date = f"{date_str[:2]}/{date_str[2:4]}/{date_str[4:]}"
-                                        dates.add(f"SM: {formatted_date}")
-                                        logger.debug(f"Found SM date: {formatted_date} from {date_str}")
-                            elif payment_mode == 'UNIONBANK' and original_line:
-                                # Initialize group_total and dates for UNIONBANK transactions
-                                if 'group_total' not in locals():
-                                    group_total = 0.0
-                                if 'dates' not in locals():
-                                    dates = set()
-                                    
-                                # For UNIONBANK, extract amount from the line
-                                amount_match = re.search(r'(\d{12})(?:DB|LC)\d*\s*$', original_line)
-                                if amount_match:
-                                    amount_str = amount_match.group(1)
-                                    amount = float(amount_str) / 100
-                                    group_total += amount
-                                    total_amount += amount  # Add to total_amount as well
-                                    logger.debug(f"Found UNIONBANK amount: {amount} from {amount_str}")
-
-                                # Extract date that appears after UB followed by digits
-                                date_match = re.search(r'UB\d+\s+(\d{6})', original_line)
-                                if date_match:
-                                    date_str = date_match.group(1)
-                                    logger.debug(f"Raw date string from UNIONBANK line: {date_str}")
-                                    formatted_date = f"{date_str[:2]}/{date_str[2:4]}/{date_str[4:]}"
-                                    dates.add(f"UNIONBANK: {formatted_date}")
-                                    logger.debug(f"Formatted UNIONBANK date: {formatted_date} from {date_str}")
-                            else:
-                                amount = trans.get('amount', 0)
-                                if isinstance(amount, (int, float)):
-                                    total_amount += float(amount)
-
                 # Write totals
                 writer.writerow(['Total Transactions', total_transactions])
                 writer.writerow(['Total Amount', f'₱{total_amount:,.2f}'])
@@ -641,184 +715,180 @@ def generate_report():
                 # Write ATM breakdown
                 writer.writerow(['ATM REFERENCE BREAKDOWN'])
                 writer.writerow(['ATM Reference', 'Transactions', 'Amount', 'Dates'])
-
-                # Process each ATM reference group
-                for atm_ref, transactions in processed_data.items():
-                    if not isinstance(transactions, list):
-                        continue
-
-                    group_total = 0.0  # Initialize group_total here
-                    dates = set()  # Initialize dates set here
-
-                    # Process each transaction
-                    for trans in transactions:
-                        if isinstance(trans, dict):
-                            payment_mode = trans.get('payment_mode', '')
-                            original_line = trans.get('original_line', '')
-                            raw_row = trans.get('raw_row', [])
-
-                            # Calculate amount based on payment mode
-                            if payment_mode == 'SM' and original_line:
-                                # For SM, extract amount from the line
-                                cs_pos = original_line.find('CS')
-                                if cs_pos > 0:
-                                    # Look backwards from CS to find the amount
-                                    amount_str = ''
-                                    for i in range(cs_pos - 1, max(0, cs_pos - 10), -1):
-                                        if original_line[i].isdigit():
-                                            amount_str = original_line[i] + amount_str
-                                        else:
-                                            break
-                                    
-                                    if amount_str:
-                                        amount = float(amount_str) / 100
-                                        group_total += amount
-                                        total_amount += amount  # Add to total_amount as well
-                                        logger.debug(f"Found SM amount for ATM {atm_ref}: {amount} from {amount_str}")
-
-                                # Extract date from positions 3-11 (MMDDYYYY format)
-                                if len(original_line) >= 11:
-                                    date_str = original_line[3:11]
-                                    if date_str:
-                                        formatted_date = f"{date_str[:2]}/{date_str[2:4]}/{date_str[4:]}"
-                                        dates.add(f"SM: {formatted_date}")
-                                        logger.debug(f"Found SM date: {formatted_date} from {date_str}")
-                            elif payment_mode == 'METROBANK' and original_line:
-                                # For METROBANK, extract amount from the line
-                                amount_match = re.search(r'(\d{11,12})[A-Z]', original_line)
-                                if amount_match:
-                                    amount_str = amount_match.group(1)
-                                    amount = float(amount_str) / 100
-                                    group_total += amount
-                                    logger.debug(f"Found METROBANK amount: {amount} from {amount_str}")
-
-                                # Extract date from the last field of the line
-                                fields = original_line.split()
-                                if fields:  # Check if we have any fields
-                                    last_field = fields[-1]  # Get the last field
-                                    
-                                    # First try to find a 6-digit date at the start of the field
-                                    if len(last_field) >= 6 and last_field[:6].isdigit():
-                                        date_str = last_field[:6]
-                                    # If not found at start, try to find it at the end
-                                    elif len(last_field) >= 6 and last_field[-6:].isdigit():
-                                        date_str = last_field[-6:]
-                                    else:
-                                        continue  # Skip if no valid date found
-                                        
-                                    formatted_date = f"{date_str[:2]}/{date_str[2:4]}/{date_str[4:]}"
-                                    dates.add(f"METROBANK: {formatted_date}")
-                                    logger.debug(f"Found METROBANK date: {formatted_date} from {date_str}")
-                            elif payment_mode == 'UNIONBANK' and original_line:
-                                # For UNIONBANK, extract amount from the line
-                                amount_match = re.search(r'(\d{12})(?:DB|LC)\d*\s*$', original_line)
-                                if amount_match:
-                                    amount_str = amount_match.group(1)
-                                    amount = float(amount_str) / 100
-                                    group_total += amount
-                                    logger.debug(f"Found UNIONBANK amount: {amount} from {amount_str}")
-
-                                # Extract date that appears after UB followed by digits
-                                date_match = re.search(r'UB\d+\s+(\d{6})', original_line)
-                                if date_match:
-                                    date_str = date_match.group(1)
-                                    logger.debug(f"Raw date string from UNIONBANK line: {date_str}")
-                                    formatted_date = f"{date_str[:2]}/{date_str[2:4]}/{date_str[4:]}"
-                                    dates.add(f"UNIONBANK: {formatted_date}")
-                                    logger.debug(f"Formatted UNIONBANK date: {formatted_date} from {date_str}")
-                            else:
-                                amount = trans.get('amount', 0)
-                                if isinstance(amount, (int, float)):
-                                    group_total += float(amount)
-
-                                # Handle dates for other payment modes
-                                if payment_mode == 'BDO' and len(raw_row) > 2:
-                                    date_str = raw_row[2].strip()
-                                    if date_str:
-                                        dates.add(f"BDO: {date_str}")
-                                elif payment_mode == 'CEBUANA' and len(raw_row) > 2:
-                                    date1 = raw_row[1].strip()
-                                    date2 = raw_row[2].strip()
-                                    if date1:
-                                        dates.add(f"CEBUANA Date1: {date1}")
-                                    if date2:
-                                        dates.add(f"CEBUANA Date2: {date2}")
-                                elif payment_mode == 'PNB' and len(raw_row) > 1:
-                                    date_str = raw_row[1].strip()
-                                    if date_str:
-                                        dates.add(f"PNB: {date_str}")
-                                elif payment_mode == 'CIS' and len(raw_row) > 0:
-                                    date_str = raw_row[0].strip()
-                                    if date_str:
-                                        formatted_date = f"{date_str[:2]}/{date_str[2:4]}/{date_str[4:]}"
-                                        dates.add(f"CIS: {formatted_date}")
-                                elif payment_mode == 'ECPAY' and len(raw_row) > 2:
-                                    date_str = raw_row[2].strip()
-                                    if date_str:
-                                        dates.add(f"ECPAY: {date_str}")
-                                elif payment_mode == 'CHINABANK' and len(raw_row) > 0:
-                                    date_str = raw_row[0].strip()
-                                    if date_str:
-                                        formatted_date = f"{date_str[:2]}/{date_str[2:4]}/{date_str[4:]}"
-                                        dates.add(f"CHINABANK: {formatted_date}")
-
-                    # Convert dates set to sorted list
-                    sorted_dates = sorted(list(dates))
-
-                    # Write row with dates and group total
-                    writer.writerow([
-                        atm_ref,
-                        len(transactions),
-                        f'₱{group_total:,.2f}',
-                        ', '.join(sorted_dates) if sorted_dates else ''
-                    ])
+                writer.writerows(breakdown_rows)
+            yield sink.drain()
 
             # Create individual ATM reports
             for atm_ref, transactions in processed_data.items():
                 if not isinstance(transactions, list):
                     continue
 
-                report_path = os.path.join(temp_dir, f'ATM_{atm_ref}.txt')
-
-                with open(report_path, 'w', encoding='utf-8') as f:
-                    # Write only raw transaction lines
-                    if isinstance(transactions, list):
-                        for trans in transactions:
-                            if isinstance(trans, dict) and 'original_line' in trans:
-                                f.write(f'{trans["original_line"]}\n')
-                            elif isinstance(trans, str):
-                                f.write(f'{trans}\n')
-                            elif isinstance(trans, dict) and 'raw_contents' in trans:
-                                for line in trans['raw_contents']:
-                                    f.write(f'{line}\n')
-
-            # Create zip file
-            zip_path = os.path.join(temp_dir, 'reports.zip')
-            with zipfile.ZipFile(zip_path, 'w') as zipf:
-                # Add all files except the zip itself
-                for root, _, files in os.walk(temp_dir):
-                    for file in files:
-                        if file != 'reports.zip':
-                            file_path = os.path.join(root, file)
-                            arc_name = os.path.basename(file_path)
-                            zipf.write(file_path, arc_name)
-
-            # Read zip file
-            with open(zip_path, 'rb') as f:
-                zip_data = f.read()
-
-            # Create response
-            response = make_response(zip_data)
-            response.headers['Content-Type'] = 'application/zip'
-            response.headers['Content-Disposition'] = f'attachment; filename={original_filename}_report.zip'
-            return response
-
-        finally:
-            # Clean up
-            try:
-                shutil.rmtree(temp_dir)
-            except Exception as cleanup_error:
-                logger.error(f"Error cleaning up temp directory: {cleanup_error}")
+                # Collect only raw transaction lines
+                lines = []
+                for trans in transactions:
+                    if isinstance(trans, dict) and 'original_line' in trans:
+                        lines.append(trans['original_line'])
+                    elif isinstance(trans, str):
+                        lines.append(trans)
+                    elif isinstance(trans, dict) and 'raw_contents' in trans:
+                        lines.extend(trans['raw_contents'])
+
+                # Write the whole report in one call
+                with io.TextIOWrapper(zipf.open(f'ATM_{atm_ref}.txt', 'w'), encoding='utf-8') as f:
+                    if lines:
+                        f.write('\n'.join(map(str, lines)) + '\n')
+                yield sink.drain()
+
+        # Central directory written when the archive is closed
+        yield sink.drain()
+    except Exception as e:
+        # Headers are already sent at this point, so the error can only be logged
+        logger.exception("Error streaming report: %s", e)
+        raise
+
+
+def attachment_disposition(download_name):
+    """Build a Content-Disposition header value for a file download, as send_file does"""
+    try:
+        download_name.encode('ascii')
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', download_name).encode('ascii', 'ignore').decode('ascii')
+        quoted = quote(download_name, safe="!#$&+^`|")
+        return dump_options_header('attachment', {'filename': simple, 'filename*': f"UTF-8''{quoted}"})
+    return dump_options_header('attachment', {'filename': download_name})
+
+
+@app.route('/api/generate-report', methods=['POST'])
+def generate_report():
+    try:
+        app.logger.info("Starting report generation")
+        # Report payloads repeat every transaction line, so parse them with orjson
+        data = orjson.loads(request.get_data(cache=False))
+
+        if not data or not isinstance(data, dict):
+            raise ValueError("Invalid data format received")
+
+        processed_data = data.get('processed_data', {})
+        original_filename = data.get('original_filename', 'transactions')
+
+        # Calculate totals and the ATM breakdown in a single pass
+        total_transactions = 0
+        total_amount = 0.0
+        breakdown_rows = []
+
+        # Process each ATM reference group
+        for atm_ref, transactions in processed_data.items():
+            if not isinstance(transactions, list):
+                continue
+
+            total_transactions += len(transactions)
+            group_total = 0.0
+            dates = set()
+
+            # Process each transaction
+            for trans in transactions:
+                if isinstance(trans, dict):
+                    payment_mode = trans.get('payment_mode', '')
+                    original_line = trans.get('original_line', '')
+                    raw_row = trans.get('raw_row', [])
+
+                    # Calculate amount based on payment mode
+                    if payment_mode == 'SM' and original_line:
+                        # For SM, extract amount from the line
+                        cs_pos = original_line.find('CS')
+                        if cs_pos > 0:
+                            # Look backwards from CS to find the amount
+                            start, end = find_sm_amount_offsets(original_line, cs_pos)
+                            amount_str = original_line[start:end]
+
+                            if amount_str:
+                                amount = float(amount_str) / 100
+                                group_total += amount
+                                total_amount += amount
+                                logger.debug("Found SM amount for ATM %s: %s from %s", atm_ref, amount, amount_str)
+
+                        # Extract date from positions 3-11 (MMDDYYYY format)
+                        if len(original_line) >= 11:
+                            date_str = original_line[3:11]
+                            if date_str:
+                                formatted_date = format_slash_date(date_str)
+                                dates.add(f"SM: {formatted_date}")
+                                logger.debug("Found SM date: %s from %s", formatted_date, date_str)
+                    elif payment_mode == 'METROBANK' and original_line:
+                        # For METROBANK, extract amount from the line
+                        amount_match = METROBANK_AMOUNT_PATTERN.search(original_line)
+                        if amount_match:
+                            amount_str = amount_match.group(1)
+                            amount = float(amount_str) / 100
+                            group_total += amount
+                            total_amount += amount
+                            logger.debug("Found METROBANK amount: %s from %s", amount, amount_str)
+
+                        # Extract date from the last field of the line
+                        fields = original_line.split()
+                        if fields:  # Check if we have any fields
+                            last_field = fields[-1]  # Get the last field
+
+                            # First try to find a 6-digit date at the start of the field
+                            if len(last_field) >= 6 and last_field[:6].isdigit():
+                                date_str = last_field[:6]
+                            # If not found at start, try to find it at the end
+                            elif len(last_field) >= 6 and last_field[-6:].isdigit():
+                                date_str = last_field[-6:]
+                            else:
+                                continue  # Skip if no valid date found
+
+                            formatted_date = format_slash_date(date_str)
+                            dates.add(f"METROBANK: {formatted_date}")
+                            logger.debug("Found METROBANK date: %s from %s", formatted_date, date_str)
+                    elif payment_mode == 'UNIONBANK' and original_line:
+                        # For UNIONBANK, extract amount from the line
+                        amount_str = find_unionbank_amount_digits(original_line)
+                        if amount_str:
+                            amount = float(amount_str) / 100
+                            group_total += amount
+                            total_amount += amount
+                            logger.debug("Found UNIONBANK amount: %s from %s", amount, amount_str)
+
+                        # Extract date that appears after UB followed by digits
+                        date_match = UNIONBANK_DATE_PATTERN.search(original_line)
+                        if date_match:
+                            date_str = date_match.group(1)
+                            logger.debug("Raw date string from UNIONBANK line: %s", date_str)
+                            formatted_date = format_slash_date(date_str)
+                            dates.add(f"UNIONBANK: {formatted_date}")
+                            logger.debug("Formatted UNIONBANK date: %s from %s", formatted_date, date_str)
+                    else:
+                        amount = trans.get('amount', 0)
+                        if isinstance(amount, (int, float)):
+                            group_total += float(amount)
+                            total_amount += float(amount)
+
+                        # Handle dates for other payment modes
+                        date_fields = REPORT_DATE_FIELDS.get(payment_mode)
+                        if date_fields and len(raw_row) > max(index for index, _, _ in date_fields):
+                            for index, label, is_compact in date_fields:
+                                date_str = raw_row[index].strip()
+                                if date_str:
+                                    if is_compact:
+                                        date_str = format_slash_date(date_str)
+                                    dates.add(f"{label}: {date_str}")
+
+            # Collect row with the sorted dates and group total, sorted() takes the set directly
+            breakdown_rows.append([
+                atm_ref,
+                len(transactions),
+                f'₱{group_total:,.2f}',
+                ', '.join(sorted(dates))
+            ])
+
+        # Stream the zip archive while it is being built, nothing is written to disk
+        response = Response(
+            stream_report_zip(processed_data, total_transactions, total_amount, breakdown_rows),
+            mimetype='application/zip'
+        )
+        response.headers['Content-Disposition'] = attachment_disposition(f'{original_filename}_report.zip')
+        return response
 
     except Exception as e:
         logger.error(f"Error generating report: {str(e)}")
@@ -851,49 +921,66 @@ def health_check():
     return jsonify({'status': 'healthy'})
 
 
-def process_file_in_thread(file_content, filename, processing_id):
-    """Process file in a separate thread"""
-    try:
-        # Update status to processing
-        processing_status[processing_id] = {
-            'status': 'processing',
-            'progress': 0,
-            'error': None
-        }
-
-        # Log the start of processing
-        logger.info(f"Starting to process file: {filename}")
-        logger.debug(f"File content length: {len(file_content)}")
-        logger.debug(f"First few lines of content: {file_content[:500]}")
+def replace_broken_pool(broken_pool):
+    """Swap in a fresh worker pool after a worker died, unless another thread already did"""
+    global processing_pool
+    with processing_lock:
+        if processing_pool is broken_pool:
+            processing_pool = new_processing_pool()
+            logger.warning("Worker pool was broken, started a new one")
+    broken_pool.shutdown(wait=False)
 
-        # Process the file
-        result = process_file_content(file_content, filename)
 
-        # Store results
-        processing_results[processing_id] = result
-
-        # Update status to completed
-        processing_status[processing_id] = {
-            'status': 'completed',
-            'progress': 100,
-            'error': None
-        }
+def store_processing_result(future, filename, processing_id, pool):
+    """Store the result of a file processed in the worker pool"""
+    try:
+        try:
+            result = future.result()
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory), later uploads need a working pool
+            replace_broken_pool(pool)
+            raise
+
+        # Store the serialized results together with the completed status
+        with processing_lock:
+            processing_results[processing_id] = result
+            processing_status[processing_id] = {
+                'status': 'completed',
+                'progress': 100,
+                'error': None
+            }
+            processing_finished_at[processing_id] = time.monotonic()
 
-        logger.info(f"Successfully processed file: {filename}")
-        logger.debug(f"Processed {result.get('total_transactions', 0)} transactions")
+        logger.info("Successfully processed file: %s", filename)
+        logger.debug("Stored %s bytes of processing results", len(result))
 
     except Exception as e:
-        # Log the full error details
+        # The traceback includes the one from the worker process
+        logger.exception("Error processing file: %s", e)
         error_details = traceback.format_exc()
-        logger.error(f"Error processing file: {str(e)}")
-        logger.error(f"Error details:\n{error_details}")
 
         # Update status with detailed error
-        processing_status[processing_id] = {
-            'status': 'error',
-            'progress': 0,
-            'error': f"Error processing file: {str(e)}\nDetails: {error_details}"
-        }
+        with processing_lock:
+            processing_status[processing_id] = {
+                'status': 'error',
+                'progress': 0,
+                'error': f"Error processing file: {str(e)}\nDetails: {error_details}"
+            }
+            processing_finished_at[processing_id] = time.monotonic()
+
+
+def evict_expired_results():
+    """Forget jobs that finished more than PROCESSING_RESULT_TTL seconds ago"""
+    cutoff = time.monotonic() - PROCESSING_RESULT_TTL
+    with processing_lock:
+        expired = [pid for pid, finished_at in processing_finished_at.items() if finished_at < cutoff]
+        for pid in expired:
+            del processing_finished_at[pid]
+            processing_status.pop(pid, None)
+            processing_results.pop(pid, None)
+
+    if expired:
+        logger.info("Evicted %s expired processing results", len(expired))
 
 
 @app.route('/api/upload-file', methods=['POST'])
@@ -905,57 +992,37 @@ def upload_file():
     if file.filename == '':
         return jsonify({'error': 'No file selected'}), 400
 
-    try:
-        # Generate a unique processing ID
-        processing_id = str(uuid.uuid4())
-
-        # Read file content in chunks
-        content = []
-        chunk_size = 5 * 1024 * 1024  # 5MB chunks
-
-        while True:
-            chunk = file.read(chunk_size)
-            if not chunk:
-                break
-            content.append(chunk)
-
-            # Process chunks as they come in to reduce memory usage
-            if len(content) >= 20:  # Process every 100MB (20 chunks of 5MB)
-                partial_content = b''.join(content)
-                content = [partial_content]  # Keep only the combined content
+    # Generate a unique processing ID
+    processing_id = str(uuid.uuid4())
 
-        # Combine remaining chunks and decode
-        content = b''.join(content)
+    try:
 
-        # Try different encodings
-        encodings = ['utf-8', 'cp1252', 'iso-8859-1', 'latin1']
-        decoded_content = None
+        # Read the whole upload in one call, werkzeug has already spooled it to memory or disk
+        content = file.read()
 
-        for encoding in encodings:
-            try:
-                decoded_content = content.decode(encoding)
-                logger.debug(f"Successfully decoded file using {encoding} encoding")
-                break
-            except UnicodeDecodeError:
-                continue
-
-        if decoded_content is None:
-            raise ValueError("Could not decode file content with any supported encoding")
+        # Drop old jobs, then set the status to processing before the worker can finish
+        evict_expired_results()
+        with processing_lock:
+            processing_status[processing_id] = {
+                'status': 'processing',
+                'progress': 0,
+                'error': None
+            }
 
-        # Initialize processing status
-        processing_status[processing_id] = {
-            'status': 'initialized',
-            'progress': 0,
-            'error': None
-        }
+        # Log the start of processing
+        logger.info(f"Starting to process file: {file.filename}")
 
-        # Start processing in a separate thread
-        thread = threading.Thread(
-            target=process_file_in_thread,
-            args=(decoded_content, file.filename, processing_id)
-        )
-        thread.daemon = True
-        thread.start()
+        # Decode and parse the file in a worker process so it does not hold this process's GIL,
+        # raw bytes also cross the process boundary without the encode/decode a str needs
+        filename = file.filename
+        pool = processing_pool
+        try:
+            future = pool.submit(process_upload, content, filename)
+        except BrokenProcessPool:
+            replace_broken_pool(pool)
+            pool = processing_pool
+            future = pool.submit(process_upload, content, filename)
+        future.add_done_callback(lambda done: store_processing_result(done, filename, processing_id, pool))
 
         return jsonify({
             'processing_id': processing_id,
@@ -964,339 +1031,222 @@ def upload_file():
 
     except Exception as e:
         logger.error(f"Error uploading file: {str(e)}")
+        # The job never started, stamp it finished so evict_expired_results can forget it
+        with processing_lock:
+            if processing_id in processing_status:
+                processing_status[processing_id] = {
+                    'status': 'error',
+                    'progress': 0,
+                    'error': f"Error uploading file: {str(e)}"
+                }
+                processing_finished_at[processing_id] = time.monotonic()
         return jsonify({'error': str(e)}), 500
 
 
 @app.route('/api/processing-status/<processing_id>', methods=['GET'])
 def get_processing_status(processing_id):
-    if processing_id not in processing_status:
-        return jsonify({'error': 'Processing ID not found'}), 404
+    with processing_lock:
+        status = processing_status.get(processing_id)
+        result = processing_results.get(processing_id)
 
-    status = processing_status[processing_id]
+    if status is None:
+        return jsonify({'error': 'Processing ID not found'}), 404
 
     if status['status'] == 'completed':
-        # Get the results from processing
-        results = processing_results[processing_id]
+        # The response was built and serialized once, when processing finished
+        return Response(result, mimetype='application/json')
 
-        # Convert the grouped data into the expected format
-        processed_data = {}
-        raw_contents = []
+    return jsonify(status)
 
-        # Calculate total amount from backend data
-        backend_total = 0
-        total_transactions = 0
-        grouped_data = results.get('grouped_data', {})
 
-        # Process the grouped data
-        for atm_ref, data in grouped_data.items():
-            if not isinstance(data, dict):
-                continue
+def display_separator(payment_mode, grouped_data):
+    """Return the separator the frontend uses to display the file's raw lines"""
+    # Every group carries the file's payment mode, so only a file with groups has one
+    if not grouped_data:
+        return ','
+    return DISPLAY_SEPARATORS.get(payment_mode, ',')
 
-            # Create an entry for each transaction in raw_contents
-            transactions = []
 
-            # Add all raw contents to the list first
-            raw_contents.extend(data.get('raw_contents', []))
+def build_status_payload(results):
+    """Convert processing results into the completed processing-status payload"""
+    # Convert the grouped data into the expected format
+    processed_data = {}
+    raw_contents = []
 
-            # Get the payment mode
-            payment_mode = data.get('payment_mode', 'Unknown')
+    # Calculate total amount from backend data
+    backend_total = 0
+    total_transactions = 0
+    grouped_data = results.get('grouped_data', {})
 
-            # For METROBANK, use the total amount already calculated
-            if payment_mode == 'METROBANK':
-                transaction_count = data.get('transaction_count', 0)
-                total_transactions += transaction_count
-                backend_total += data.get('total_amount', 0)  # Add the pre-calculated total
+    # Process the grouped data
+    for atm_ref, data in grouped_data.items():
+        if not isinstance(data, dict):
+            continue
 
-                # Create one transaction object per raw content line
-                for line in data.get('raw_contents', []):
-                    # Extract amount from index 3 if it's followed by letters
-                    amount = 0
-                    fields = [f.strip() for f in line.split() if f.strip()]
-                    if len(fields) > 3:
-                        amount_field = fields[3].strip()
-                        # Check if the field contains digits followed by letters
-                        amount_match = re.match(r'^(\d+)[A-Z]', amount_field)
-                        if amount_match:
-                            amount_str = amount_match.group(1)
-                            amount = float(amount_str) / 100
-                            grouped_data[atm_ref]['total_amount'] += amount
-                            logger.debug(f"Found METROBANK amount: {amount} from {amount_str}")
-
-                    transaction = {
-                        'payment_mode': payment_mode,
-                        'amount': amount,
-                        'raw_row': [line],
-                        'original_line': line,
-                        'display_ref': atm_ref,
-                        'group_ref': atm_ref
-                    }
-                    transactions.append(transaction)
-
-            elif payment_mode == 'SM':
-                transaction_count = data.get('transaction_count', 0)
-                total_transactions += transaction_count
-                backend_total += data.get('total_amount', 0)
-
-                # Create one transaction object per raw content line
-                for line in data.get('raw_contents', []):
-                    # Extract amount from the line
-                    amount = 0
-                    cs_pos = line.find('CS')
-                    if cs_pos > 0:
-                        # Look backwards from CS to find the amount
-                        amount_str = ''
-                        for i in range(cs_pos - 1, max(0, cs_pos - 10), -1):
-                            if line[i].isdigit():
-                                amount_str = line[i] + amount_str
-                            else:
-                                break
-                        
-                        if amount_str:
-                            amount = float(amount_str) / 100
-                            backend_total += amount
-                            logger.debug(f"Found SM amount: {amount} from {amount_str}")
-
-                    # Extract ATM reference
-                    atm_ref = line[18:31] if len(line) >= 45 else '0000'
-                    first_four = atm_ref[:4]
-
-                    transaction = {
-                        'payment_mode': payment_mode,
-                        'amount': amount,
-                        'raw_row': [line],
-                        'original_line': line,
-                        'display_ref': first_four,
-                        'group_ref': first_four
-                    }
-                    transactions.append(transaction)
+        # Create an entry for each transaction in raw_contents
+        transactions = []
 
-            else:
-                # Process each line to create transaction objects for other payment modes
-                for line in data.get('raw_contents', []):
-                    # Split line based on payment mode
-                    if payment_mode == 'BDO':
-                        fields = line.strip().split('|')
-                    elif payment_mode == 'CHINABANK':
-                        fields = [f for f in re.split(r'\s+', line.strip()) if f.strip()]
-                    elif payment_mode in ['CIS', 'PNB']:
-                        fields = [f.strip() for f in line.split('^')]
-                    else:
-                        fields = [f.strip() for f in line.split(',')]
+        # Add all raw contents to the list first
+        raw_contents.extend(data.get('raw_contents', []))
 
-                    # Extract amount based on payment mode
-                    amount = 0
-                    display_ref = None
-                    group_ref = None
-
-                    if payment_mode == 'PNB':
-                        # For PNB, amount is at index 6
-                        if len(fields) > 6:
-                            try:
-                                amount_str = fields[6].replace(',', '')
-                                amount = float(amount_str)
-                                backend_total += amount
-                            except (ValueError, TypeError) as e:
-                                logger.error(f"Error converting PNB amount: {fields[6]}, error: {str(e)}")
-                                amount = 0
-
-                        # For PNB, handle ATM reference at index 4
-                        if len(fields) > 4:
-                            atm_ref_field = fields[4].strip()
-                            clean_ref = ''.join(c for c in atm_ref_field if c.isdigit())
-                            if len(clean_ref) >= 4:
-                                display_ref = clean_ref[:4]
-                                group_ref = clean_ref[:4]
-
-                    elif payment_mode == 'BDO':
-                        # For BDO, amount is at index 9
-                        if len(fields) > 9:
-                            try:
-                                amount_str = fields[9].strip()
-                                amount = float(amount_str)
-                                backend_total += amount
-                            except (ValueError, TypeError) as e:
-                                logger.error(f"Error converting BDO amount: {fields[9]}, error: {str(e)}")
-                                amount = 0
-
-                        # For BDO, handle ATM reference at index 5
-                        if len(fields) > 5:
-                            atm_ref_field = fields[5].strip()
-                            clean_ref = ''.join(c for c in atm_ref_field if c.isdigit())
-                            if len(clean_ref) >= 4:
-                                display_ref = clean_ref[:4]
-                                group_ref = clean_ref[:4]
-
-                    elif payment_mode == 'ECPAY':
-                        # For ECPAY, amount is in index 6
-                        if len(fields) > 6:
-                            try:
-                                amount_str = fields[6].replace(',', '')
-                                amount = float(amount_str)
-                                backend_total += amount
-                            except (ValueError, TypeError) as e:
-                                logger.error(f"Error converting ECPAY amount: {fields[6]}, error: {str(e)}")
-                                amount = 0
-
-                        # For ECPAY, handle ATM reference at index 5
-                        if len(fields) > 5:
-                            atm_ref_field = fields[5].strip()
-                            clean_ref = ''.join(c for c in atm_ref_field if c.isdigit())
-                            if len(clean_ref) >= 4:
-                                display_ref = clean_ref[:4]
-                                group_ref = clean_ref[:4]
-
-                    elif payment_mode == 'CHINABANK':
-                        # For CHINABANK, amount is at index 2
-                        if len(fields) > 2:
-                            try:
-                                amount_str = fields[2].replace(',', '')
-                                amount = float(amount_str)
-                                backend_total += amount
-                            except (ValueError, TypeError) as e:
-                                logger.error(f"Error converting CHINABANK amount: {fields[2]}, error: {str(e)}")
-                                amount = 0
-
-                        # For CHINABANK, handle ATM reference at index 3
-                        if len(fields) > 3:
-                            atm_ref_field = fields[3].strip()
-                            clean_ref = ''.join(c for c in atm_ref_field if c.isdigit())
-                            if len(clean_ref) >= 4:
-                                display_ref = clean_ref[:4]
-                                group_ref = clean_ref[:4]
-
-                    elif payment_mode == 'CEBUANA':
-                        # For CEBUANA, amount is at index 6
-                        if len(fields) > 6:
-                            try:
-                                amount_str = fields[6].replace(',', '')
-                                amount = float(amount_str)
-                                backend_total += amount
-                            except (ValueError, TypeError) as e:
-                                logger.error(f"Error converting CEBUANA amount: {fields[6]}, error: {str(e)}")
-                                amount = 0
-
-                        # For CEBUANA, handle ATM reference at index 4
-                        if len(fields) > 4:
-                            atm_ref_field = fields[4].strip()
-                            clean_ref = ''.join(c for c in atm_ref_field if c.isdigit())
-                            if len(clean_ref) >= 4:
-                                display_ref = clean_ref[:4]
-                                group_ref = clean_ref[:4]
-
-                    elif payment_mode == 'CIS':
-                        # For CIS, amount is at index 2
-                        if len(fields) > 2:
-                            try:
-                                amount_str = fields[2].replace(',', '')
-                                amount = float(amount_str)
-                                backend_total += amount
-                            except (ValueError, TypeError) as e:
-                                logger.error(f"Error converting CIS amount: {fields[2]}, error: {str(e)}")
-                                amount = 0
-
-                        # For CIS, handle ATM reference at index 1
-                        if len(fields) > 1:
-                            atm_ref_field = fields[1].strip()
-                            clean_ref = ''.join(c for c in atm_ref_field if c.isdigit())
-                            if len(clean_ref) >= 4:
-                                display_ref = clean_ref[:4]
-                                group_ref = clean_ref[:4]
-
-                    elif payment_mode == 'UNIONBANK':
-                        # For UNIONBANK, find amount at the end of the line
+        # Get the payment mode
+        payment_mode = data.get('payment_mode', 'Unknown')
+
+        # For METROBANK, use the total amount already calculated
+        if payment_mode == 'METROBANK':
+            transaction_count = data.get('transaction_count', 0)
+            total_transactions += transaction_count
+            backend_total += data.get('total_amount', 0)  # Add the pre-calculated total
+
+            # Create one transaction object per raw content line, using the amounts parsed on upload
+            for line, amount in zip(data.get('raw_contents', []), data.get('amounts', [])):
+                transaction = {
+                    'payment_mode': payment_mode,
+                    'amount': amount,
+                    'raw_row': [line],
+                    'original_line': line,
+                    'display_ref': atm_ref,
+                    'group_ref': atm_ref
+                }
+                transactions.append(transaction)
+
+        elif payment_mode == 'SM':
+            transaction_count = data.get('transaction_count', 0)
+            total_transactions += transaction_count
+            backend_total += data.get('total_amount', 0)
+
+            # Create one transaction object per raw content line, using the amounts parsed on upload
+            for line, amount in zip(data.get('raw_contents', []), data.get('amounts', [])):
+                backend_total += amount
+
+                # Extract ATM reference
+                atm_ref = line[18:31] if len(line) >= 45 else '0000'
+                # Share one string per ATM group across the transactions that keep it
+                first_four = sys.intern(atm_ref[:4])
+
+                transaction = {
+                    'payment_mode': payment_mode,
+                    'amount': amount,
+                    'raw_row': [line],
+                    'original_line': line,
+                    'display_ref': first_four,
+                    'group_ref': first_four
+                }
+                transactions.append(transaction)
+
+        else:
+            # Pick the field splitter and field positions once for the whole group
+            split_fields = LINE_FIELD_SPLITTERS.get(payment_mode, split_comma_fields)
+            amount_field = LINE_AMOUNT_FIELDS.get(payment_mode)
+            ref_index = ATM_REF_FIELD_INDEX.get(payment_mode)
+
+            # Process each line to create transaction objects for other payment modes
+            for line in data.get('raw_contents', []):
+                fields = split_fields(line)
+
+                # Extract amount based on payment mode
+                amount = 0
+                display_ref = None
+                group_ref = None
+
+                if amount_field is not None:
+                    amount_index, has_separators = amount_field
+                    if len(fields) > amount_index:
                         try:
-                            # Look for amount followed by either DB or LC (with or without additional digits)
-                            amount_match = re.search(r'(\d{12})(?:DB|LC)\d*\s*$', line)
-                            if amount_match:
-                                amount_str = amount_match.group(1)  # Get the first 12 digits
-                                amount = float(
-                                    amount_str) / 100  # Convert to float and divide by 100 for decimal points
-                                backend_total += amount
-                            else:
-                                amount = 0
+                            amount_str = fields[amount_index]
+                            if has_separators:
+                                amount_str = amount_str.replace(',', '')
+                            amount = float(amount_str)
+                            backend_total += amount
                         except (ValueError, TypeError) as e:
-                            logger.error(f"Error converting UNIONBANK amount: {line}, error: {str(e)}")
+                            logger.error("Error converting %s amount: %s, error: %s", payment_mode, fields[amount_index], e)
                             amount = 0
 
-                        # For UNIONBANK, handle ATM reference from the line
-                        # First try to find a 14-digit reference
-                        matches = re.finditer(r'\s{10,}(\d{14})\s+', line)
-                        last_match = None
-                        for match in matches:
-                            last_match = match
-
-                        if last_match:
-                            atm_ref_field = last_match.group(1)  # This gets just the digits
-                            clean_ref = atm_ref_field[:4]  # Take first 4 digits
-                            display_ref = clean_ref
-                            group_ref = clean_ref
+                    # Handle the ATM reference at the mode's field index
+                    if len(fields) > ref_index:
+                        clean_ref = keep_digits(fields[ref_index].strip())
+                        if len(clean_ref) >= 4:
+                            # Share one string per ATM group across the transactions that keep it
+                            display_ref = group_ref = sys.intern(clean_ref[:4])
+
+                elif payment_mode == 'UNIONBANK':
+                    # For UNIONBANK, find amount at the end of the line
+                    try:
+                        # Look for amount followed by either DB or LC (with or without additional digits)
+                        amount_str = find_unionbank_amount_digits(line)
+                        if amount_str:
+                            amount = float(
+                                amount_str) / 100  # Convert to float and divide by 100 for decimal points
+                            backend_total += amount
                         else:
-                            # If no 14-digit reference found, try to find any sequence of digits
-                            # that could be an ATM reference (at least 4 digits)
-                            ref_match = re.search(r'\s{10,}(\d{4,})\s+', line)
-                            if ref_match:
-                                atm_ref_field = ref_match.group(1)
-                                clean_ref = atm_ref_field[:4]  # Take first 4 digits
-                                display_ref = clean_ref
-                                group_ref = clean_ref
-                            else:
-                                # If still no reference found, try to get it from index 4
-                                fields = line.strip().split()
-                                if len(fields) > 4:
-                                    atm_ref_field = fields[4]
-                                    clean_ref = ''.join(c for c in atm_ref_field if c.isdigit())[:4]
-                                    if len(clean_ref) >= 4:
-                                        display_ref = clean_ref
-                                        group_ref = clean_ref
-                                    else:
-                                        display_ref = '0000'
-                                        group_ref = '0000'
-                                else:
-                                    display_ref = '0000'
-                                    group_ref = '0000'
-
-                    transaction = {
-                        'payment_mode': payment_mode,
-                        'amount': amount,
-                        'raw_row': fields,
-                        'original_line': line,
-                        'display_ref': display_ref,
-                        'group_ref': group_ref
-                    }
-
-                    transactions.append(transaction)
-                    total_transactions += 1
-
-            # Group transactions based on display_ref if available, otherwise use atm_ref
-            if transactions and 'display_ref' in transactions[0]:
-                group_key = transactions[0]['display_ref']
-            else:
-                group_key = atm_ref
+                            amount = 0
+                    except (ValueError, TypeError) as e:
+                        logger.error(f"Error converting UNIONBANK amount: {line}, error: {str(e)}")
+                        amount = 0
+
+                    # For UNIONBANK, handle ATM reference from the line
+                    display_ref, fallback_fields = find_unionbank_atm_ref(line)
+                    display_ref = group_ref = sys.intern(display_ref)
+                    if fallback_fields is not None:
+                        fields = fallback_fields
+
+                transaction = {
+                    'payment_mode': payment_mode,
+                    'amount': amount,
+                    'raw_row': fields,
+                    'original_line': line,
+                    'display_ref': display_ref,
+                    'group_ref': group_ref
+                }
+
+                transactions.append(transaction)
+                total_transactions += 1
+
+        # Group transactions based on display_ref if available, otherwise use atm_ref
+        if transactions and 'display_ref' in transactions[0]:
+            group_key = transactions[0]['display_ref']
+        else:
+            group_key = atm_ref
+
+        processed_data[group_key] = transactions
+
+    # Use the total_transactions we counted
+    return {
+        'status': 'completed',
+        'progress': 100,
+        'processed_data': processed_data,
+        'raw_contents': raw_contents,
+        'separator': results['separator'],
+        'summary': {
+            'total_amount': backend_total,
+            'total_transactions': total_transactions
+        }
+    }
 
-            processed_data[group_key] = transactions
 
-        # Determine separator based on payment mode
-        payment_modes = {data.get('payment_mode') for data in grouped_data.values() if isinstance(data, dict)}
-        separator = '^' if 'PNB' in payment_modes else (
-            '|' if 'BDO' in payment_modes else (
-                ' ' if any(mode in ['METROBANK', 'CHINABANK'] for mode in payment_modes) else ','
-            )
-        )
+def decode_upload(content):
+    """Decode uploaded bytes with the first supported encoding that accepts them"""
+    for encoding in UPLOAD_ENCODINGS:
+        try:
+            decoded_content = content.decode(encoding)
+            logger.debug("Successfully decoded file using %s encoding", encoding)
+            return decoded_content
+        except UnicodeDecodeError:
+            continue
 
-        # Use the total_transactions we counted
-        return jsonify({
-            'status': 'completed',
-            'progress': 100,
-            'processed_data': processed_data,
-            'raw_contents': raw_contents,
-            'separator': separator,
-            'summary': {
-                'total_amount': backend_total,
-                'total_transactions': total_transactions
-            }
-        })
+    raise ValueError("Could not decode file content with any supported encoding")
 
-    return jsonify(status)
+
+def process_upload(content, filename):
+    """Process an uploaded file and return its serialized processing-status payload"""
+    decoded_content = decode_upload(content)
+    logger.debug("File content length: %s", len(decoded_content))
+    logger.debug("First few lines of content: %s", decoded_content[:500])
+
+    results = process_file_content(decoded_content, filename)
+    # Groups without an ATM reference are keyed by None, which json would write as "null".
+    # Keys are sorted to match the output of jsonify
+    return orjson.dumps(build_status_payload(results), option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SORT_KEYS)
 
 
 def process_file_content(content, filename):
@@ -1314,522 +1264,242 @@ def process_file_content(content, filename):
         # Split content into lines
         lines = content.strip().split('\n')
         logger.info(f"Processing {len(lines)} lines")
+        # Drop blank lines once rather than stripping each line in every payment mode loop
+        lines = [line for line in lines if line and not line.isspace()]
 
-        # Group data by ATM reference
-        grouped_data = {}
+        # Group data by ATM reference, creating each group on its first line
+        grouped_data = defaultdict(atm_group_factory(payment_mode))
 
         # Process based on payment mode
-        if payment_mode == 'CIS':
-            # CIS specific processing
-            for line in lines:
-                if not line.strip():
-                    continue
+        if payment_mode in LINE_AMOUNT_FIELDS:
+            # Delimited payment modes only differ in their separator and field positions
+            split_fields = LINE_FIELD_SPLITTERS.get(payment_mode, split_comma_fields)
+            maxsplit = LINE_MAXSPLIT[payment_mode]
+            amount_index, has_separators = LINE_AMOUNT_FIELDS[payment_mode]
+            date_fields = LINE_DATE_FIELDS[payment_mode]
 
+            for line in lines:
                 raw_contents.append(line)
-                # For CIS, split by caret
-                fields = [f.strip() for f in line.split('^')]
+                fields = split_fields(line, maxsplit)
 
-                # For CIS, ATM ref is in index 1
-                if len(fields) > 1:
-                    atm_ref_field = fields[1].strip()
-                    # Clean the reference (keep only digits)
-                    clean_ref = ''.join(c for c in atm_ref_field if c.isdigit())
-                    # Take first 4 digits as ATM ref
-                    if len(clean_ref) >= 4:
-                        atm_ref = clean_ref[:4]
-                        logger.debug(f"Found CIS ATM ref: {atm_ref} from {atm_ref_field}")
-
-                        if atm_ref not in grouped_data:
-                            grouped_data[atm_ref] = {
-                                'raw_contents': [],
-                                'transaction_count': 0,
-                                'total_amount': 0.0,
-                                'payment_mode': payment_mode,
-                                'dates': set()  # Initialize dates set
-                            }
-                        grouped_data[atm_ref]['raw_contents'].append(line)
-                        grouped_data[atm_ref]['transaction_count'] += 1
-
-                        # For CIS, amount is in index 2
-                        try:
-                            if len(fields) > 2:
-                                amount_str = fields[2].replace(',', '')
-                                amount = float(amount_str)
-                                grouped_data[atm_ref]['total_amount'] += amount
-                                logger.debug(f"Added CIS amount {amount} to ATM ref {atm_ref}")
-                        except (ValueError, IndexError) as e:
-                            logger.warning(f"Could not detect CIS amount in line: {line}")
+                atm_ref = detect_atm_reference_by_payment_mode(fields, payment_mode, line)
+                if not atm_ref:
+                    continue
 
-                        # For CIS, date is in index 0
-                        try:
-                            if len(fields) > 0:
-                                date_str = fields[0].strip()
-                                grouped_data[atm_ref]['dates'].add(date_str)
-                        except (ValueError, IndexError) as e:
-                            logger.warning(f"Could not detect CIS date in line: {line}")
+                group = grouped_data[atm_ref]
+                group['raw_contents'].append(line)
+                group['transaction_count'] += 1
+
+                try:
+                    if len(fields) > amount_index:
+                        amount_str = fields[amount_index]
+                        if has_separators:
+                            amount_str = amount_str.replace(',', '')
+                        amount = float(amount_str)
+                        group['total_amount'] += amount
+                        logger.debug("Added %s amount %s to ATM ref %s", payment_mode, amount, atm_ref)
+                except (ValueError, IndexError):
+                    logger.warning("Could not detect %s amount in line: %s", payment_mode, line)
+
+                # The ATM reference comes after every date field, so the dates are present here
+                try:
+                    for date_index, label, is_mmddyyyy in date_fields:
+                        date_str = fields[date_index].strip()
+                        if label is None:
+                            group['dates'].add(date_str)
+                        elif date_str:
+                            if is_mmddyyyy:
+                                # Format the date from MMDDYYYY to MM/DD/YYYY
+                                date_str = format_slash_date(date_str)
+                            group['dates'].add(f"{label}: {date_str}")
+                except (ValueError, IndexError):
+                    logger.warning("Could not detect %s date in line: %s", payment_mode, line)
 
         elif payment_mode == 'METROBANK':
             # METROBANK specific processing
-            total_metrobank_amount = 0.0  # Initialize total amount counter
+            # The amounts are whole cents, so total them as integers to keep the sums exact
+            total_metrobank_cents = 0
+            group_cents = defaultdict(int)
             for line in lines:
-                if not line.strip():
-                    continue
-
                 raw_contents.append(line)
                 # For METROBANK, split by spaces and get index 1
-                fields = [f.strip() for f in line.split() if f.strip()]
+                fields = line.split()
                 if len(fields) > 1:
                     atm_ref = fields[1].strip()
                     # Take only first 4 digits for grouping
                     atm_ref = atm_ref[:4]
-                    logger.debug(f"Found METROBANK ATM ref: {atm_ref} from field: {fields[1]}")
-
-                    if atm_ref not in grouped_data:
-                        grouped_data[atm_ref] = {
-                            'raw_contents': [],
-                            'transaction_count': 0,
-                            'total_amount': 0.0,
-                            'payment_mode': payment_mode,
-                            'dates': set()  # Initialize dates set
-                        }
-                    grouped_data[atm_ref]['raw_contents'].append(line)
-                    grouped_data[atm_ref]['transaction_count'] += 1
+                    logger.debug("Found METROBANK ATM ref: %s from field: %s", atm_ref, fields[1])
+
+                    group = grouped_data[atm_ref]
+                    group['raw_contents'].append(line)
+                    group['transaction_count'] += 1
 
                     # Extract amount from the line using regex
-                    amount_match = re.search(r'(\d{11,12})[A-Z]', line)
-                    if amount_match:
-                        amount_str = amount_match.group(1)
-                        amount = float(amount_str) / 100
-                        grouped_data[atm_ref]['total_amount'] += amount
-                        total_metrobank_amount += amount
-                        logger.debug(f"Found METROBANK amount: {amount} from {amount_str}")
-
-                    # Extract date from the line
-                    date_match = re.search(r'(\d{6})\d*$', line)
-                    if date_match:
-                        date_str = date_match.group(1)
-                        formatted_date = f"{date_str[:2]}/{date_str[2:4]}/{date_str[4:]}"
-                        grouped_data[atm_ref]['dates'].add(f"METROBANK: {formatted_date}")
-                        logger.debug(f"Found METROBANK date: {formatted_date} from {date_str}")
+                    amount = 0
+                    date_str = None
+                    line_match = METROBANK_LINE_PATTERN.search(line)
+                    if line_match:
+                        amount_str, date_str = line_match.groups()
+                        amount_cents = int(amount_str)
+                        amount = amount_cents / 100
+                        group_cents[atm_ref] += amount_cents
+                        total_metrobank_cents += amount_cents
+                        logger.debug("Found METROBANK amount: %s from %s", amount, amount_str)
+                    else:
+                        # No amount, so the date still needs its own scan
+                        date_match = METROBANK_DATE_PATTERN.search(line)
+                        if date_match:
+                            date_str = date_match.group(1)
+                    group['amounts'].append(amount)
+
+                    # Record the date found at the end of the line
+                    if date_str:
+                        formatted_date = format_slash_date(date_str)
+                        group['dates'].add(f"METROBANK: {formatted_date}")
+                        logger.debug("Found METROBANK date: %s from %s", formatted_date, date_str)
+
+            for atm_ref, cents in group_cents.items():
+                grouped_data[atm_ref]['total_amount'] = cents / 100
+            total_metrobank_amount = total_metrobank_cents / 100
 
             # Store the total amount in the results
+            grouped_data.default_factory = None
             results = {
                 'grouped_data': grouped_data,
                 'raw_contents': raw_contents,
                 'payment_mode': payment_mode,
+                'separator': display_separator(payment_mode, grouped_data),
                 'total_amount': total_metrobank_amount
             }
             logger.info(f"Total METROBANK amount: {total_metrobank_amount}")
             return results
 
-        elif payment_mode == 'PNB':
-            # PNB specific processing
-            for line in lines:
-                if not line.strip():
-                    continue
-
-                raw_contents.append(line)
-                # For PNB, split by caret
-                fields = [f.strip() for f in line.split('^')]
-
-                # For PNB, ATM ref is in field 5 (index 4)
-                if len(fields) > 4:
-                    atm_ref_field = fields[4].strip()
-                    # Clean the reference (keep only digits)
-                    clean_ref = ''.join(c for c in atm_ref_field if c.isdigit())
-                    # Take first 4 digits as ATM ref
-                    if len(clean_ref) >= 4:
-                        atm_ref = clean_ref[:4]
-                        logger.debug(f"Found PNB ATM ref: {atm_ref} from {atm_ref_field}")
-
-                        if atm_ref not in grouped_data:
-                            grouped_data[atm_ref] = {
-                                'raw_contents': [],
-                                'transaction_count': 0,
-                                'total_amount': 0.0,
-                                'payment_mode': payment_mode,
-                                'dates': set()  # Initialize dates set
-                            }
-                        grouped_data[atm_ref]['raw_contents'].append(line)
-                        grouped_data[atm_ref]['transaction_count'] += 1
-
-                        # For PNB, amount is in field 7 (index 6)
-                        try:
-                            if len(fields) > 6:
-                                amount_str = fields[6].replace(',', '')
-                                amount = float(amount_str)
-                                grouped_data[atm_ref]['total_amount'] += amount
-                                logger.debug(f"Added PNB amount {amount} to ATM ref {atm_ref}")
-                        except (ValueError, IndexError) as e:
-                            logger.warning(f"Could not detect PNB amount in line: {line}")
-
-                        # For PNB, date is in index 1
-                        try:
-                            if len(fields) > 1:
-                                date_str = fields[1].strip()
-                                grouped_data[atm_ref]['dates'].add(date_str)
-                        except (ValueError, IndexError) as e:
-                            logger.warning(f"Could not detect PNB date in line: {line}")
-
-        elif payment_mode == 'BDO':
-            # BDO specific processing
-            for line in lines:
-                if not line.strip():
-                    continue
-
-                raw_contents.append(line)
-                fields = line.strip().split('|')
-
-                atm_ref = detect_atm_reference_by_payment_mode(fields, payment_mode, line)
-                if atm_ref:
-                    if atm_ref not in grouped_data:
-                        grouped_data[atm_ref] = {
-                            'raw_contents': [],
-                            'transaction_count': 0,
-                            'total_amount': 0.0,
-                            'payment_mode': payment_mode,
-                            'dates': set()  # Initialize dates set
-                        }
-                    grouped_data[atm_ref]['raw_contents'].append(line)
-                    grouped_data[atm_ref]['transaction_count'] += 1
-
-                    # For BDO, amount is in index 9
-                    try:
-                        if len(fields) > 9:
-                            amount_str = fields[9].strip()
-                            amount = float(amount_str)
-                            grouped_data[atm_ref]['total_amount'] += amount
-                            logger.debug(f"Added BDO amount {amount} to ATM ref {atm_ref}")
-                    except (ValueError, IndexError) as e:
-                        logger.warning(f"Could not detect BDO amount in line: {line}")
-
-                    # Extract date from index 2
-                    try:
-                        if len(fields) > 2:
-                            date_str = fields[2].strip()
-                            grouped_data[atm_ref]['dates'].add(date_str)
-                    except (ValueError, IndexError) as e:
-                        logger.warning(f"Could not detect BDO date in line: {line}")
-
-        elif payment_mode == 'ECPAY':
-            # ECPAY specific processing
-            for line in lines:
-                if not line.strip():
-                    continue
-
-                raw_contents.append(line)
-                # For ECPAY, split by comma
-                fields = [f.strip() for f in line.split(',')]
-
-                atm_ref = detect_atm_reference_by_payment_mode(fields, payment_mode, line)
-                if atm_ref:
-                    if atm_ref not in grouped_data:
-                        grouped_data[atm_ref] = {
-                            'raw_contents': [],
-                            'transaction_count': 0,
-                            'total_amount': 0.0,
-                            'payment_mode': payment_mode,
-                            'dates': set()  # Initialize dates set
-                        }
-                    grouped_data[atm_ref]['raw_contents'].append(line)
-                    grouped_data[atm_ref]['transaction_count'] += 1
-
-                    # For ECPAY, amount is in index 6
-                    try:
-                        if len(fields) > 6:
-                            amount_str = fields[6].replace(',', '')
-                            amount = float(amount_str)
-                            grouped_data[atm_ref]['total_amount'] += amount
-                            logger.debug(f"Added ECPAY amount {amount} to ATM ref {atm_ref}")
-                    except (ValueError, IndexError) as e:
-                        logger.warning(f"Could not detect ECPAY amount in line: {line}")
-
-                    # For ECPAY, date is in index 2
-                    try:
-                        if len(fields) > 2:
-                            date_str = fields[2].strip()
-                            if date_str:
-                                grouped_data[atm_ref]['dates'].add(f"ECPAY: {date_str}")
-                    except (ValueError, IndexError) as e:
-                        logger.warning(f"Could not detect ECPAY date in line: {line}")
-
-        elif payment_mode == 'CHINABANK':
-            # CHINABANK specific processing
-            for line in lines:
-                if not line.strip():
-                    continue
-
-                raw_contents.append(line)
-                # Split by multiple spaces for CHINABANK's fixed-width format
-                fields = [f for f in re.split(r'\s+', line.strip()) if f.strip()]
-
-                # For CHINABANK, ATM ref is in index 3
-                if len(fields) > 3:
-                    atm_ref_field = fields[3].strip()
-                    # Clean the reference (keep only digits)
-                    clean_ref = ''.join(c for c in atm_ref_field if c.isdigit())
-                    # Take first 4 digits as ATM ref
-                    if len(clean_ref) >= 4:
-                        atm_ref = clean_ref[:4]
-                        logger.debug(f"Found CHINABANK ATM ref: {atm_ref} from {atm_ref_field}")
-
-                        if atm_ref not in grouped_data:
-                            grouped_data[atm_ref] = {
-                                'raw_contents': [],
-                                'transaction_count': 0,
-                                'total_amount': 0.0,
-                                'payment_mode': payment_mode,
-                                'dates': set()  # Initialize dates set
-                            }
-                        grouped_data[atm_ref]['raw_contents'].append(line)
-                        grouped_data[atm_ref]['transaction_count'] += 1
-
-                        # For CHINABANK, amount is in index 2
-                        try:
-                            if len(fields) > 2:
-                                amount_str = fields[2].replace(',', '')
-                                amount = float(amount_str)
-                                grouped_data[atm_ref]['total_amount'] += amount
-                                logger.debug(f"Added CHINABANK amount {amount} to ATM ref {atm_ref}")
-                        except (ValueError, IndexError) as e:
-                            logger.warning(f"Could not detect CHINABANK amount in line: {line}")
-
-                        # For CHINABANK, date is in index 0
-                        try:
-                            if len(fields) > 0:
-                                date_str = fields[0].strip()
-                                if date_str:
-                                    # Format the date from MMDDYYYY to MM/DD/YYYY
-                                    formatted_date = f"{date_str[:2]}/{date_str[2:4]}/{date_str[4:]}"
-                                    grouped_data[atm_ref]['dates'].add(f"CHINABANK: {formatted_date}")
-                        except (ValueError, IndexError) as e:
-                            logger.warning(f"Could not detect CHINABANK date in line: {line}")
-
-        elif payment_mode == 'CEBUANA':
-            # CEBUANA specific processing
-            for line in lines:
-                if not line.strip():
-                    continue
-
-                raw_contents.append(line)
-                # For CEBUANA, split by comma
-                fields = [f.strip() for f in line.split(',')]
-
-                # For CEBUANA, ATM ref is in index 4
-                if len(fields) > 4:
-                    atm_ref_field = fields[4].strip()
-                    # Clean the reference (keep only digits)
-                    clean_ref = ''.join(c for c in atm_ref_field if c.isdigit())
-                    # Take first 4 digits as ATM ref
-                    if len(clean_ref) >= 4:
-                        atm_ref = clean_ref[:4]
-                        logger.debug(f"Found CEBUANA ATM ref: {atm_ref} from {atm_ref_field}")
-
-                        if atm_ref not in grouped_data:
-                            grouped_data[atm_ref] = {
-                                'raw_contents': [],
-                                'transaction_count': 0,
-                                'total_amount': 0.0,
-                                'payment_mode': payment_mode,
-                                'dates': set()  # Initialize dates set
-                            }
-                        grouped_data[atm_ref]['raw_contents'].append(line)
-                        grouped_data[atm_ref]['transaction_count'] += 1
-
-                        # For CEBUANA, amount is in index 6 (last field)
-                        try:
-                            if len(fields) > 6:
-                                amount_str = fields[6].replace(',', '')
-                                amount = float(amount_str)
-                                grouped_data[atm_ref]['total_amount'] += amount
-                                logger.debug(f"Added CEBUANA amount {amount} to ATM ref {atm_ref}")
-                        except (ValueError, IndexError) as e:
-                            logger.warning(f"Could not detect CEBUANA amount in line: {line}")
-
-                        # For CEBUANA, dates are in index 1 and 2
-                        try:
-                            if len(fields) > 2:
-                                date1 = fields[1].strip()
-                                date2 = fields[2].strip()
-                                if date1:
-                                    grouped_data[atm_ref]['dates'].add(f"Date1: {date1}")
-                                if date2:
-                                    grouped_data[atm_ref]['dates'].add(f"Date2: {date2}")
-                        except (ValueError, IndexError) as e:
-                            logger.warning(f"Could not detect CEBUANA dates in line: {line}")
-
         elif payment_mode == 'UNIONBANK':
             # UNIONBANK specific processing
             current_atm_ref = None  # Track current ATM reference
+            # Lines already in each group, so repeated lines are skipped without scanning raw_contents
+            seen_lines = defaultdict(set)
+            # The amounts are whole cents, so total them as integers to keep the sums exact
+            group_cents = defaultdict(int)
 
             for line in lines:
-                if not line.strip():
-                    continue
-
                 # For UNIONBANK, we want to keep all lines
                 # First, try to find a line with an ATM reference
                 if len(line) >= 200:  # Check if line is long enough to contain ATM ref
                     # Look for the ATM reference pattern in the line
-                    matches = re.finditer(r'\s{10,}(\d{14})\s+', line)
-                    last_match = None
-                    for match in matches:
-                        last_match = match
-
-                    if last_match:
-                        atm_ref_field = last_match.group(1)  # This gets just the digits
-                        current_atm_ref = atm_ref_field[:4]  # Take first 4 digits
-                    else:
-                        # If no 14-digit reference found, try to find any sequence of digits
-                        # that could be an ATM reference (at least 4 digits)
-                        ref_match = re.search(r'\s{10,}(\d{4,})\s+', line)
-                        if ref_match:
-                            atm_ref_field = ref_match.group(1)
-                            current_atm_ref = atm_ref_field[:4]  # Take first 4 digits
-                        else:
-                            # If still no reference found, try to get it from index 4
-                            fields = line.strip().split()
-                            if len(fields) > 4:
-                                atm_ref_field = fields[4]
-                                clean_ref = ''.join(c for c in atm_ref_field if c.isdigit())[:4]
-                                if len(clean_ref) >= 4:
-                                    current_atm_ref = clean_ref
-                                else:
-                                    current_atm_ref = '0000'
-                            else:
-                                current_atm_ref = '0000'
-
-                    if current_atm_ref not in grouped_data:
-                        grouped_data[current_atm_ref] = {
-                            'raw_contents': [],
-                            'transaction_count': 0,
-                            'total_amount': 0.0,
-                            'payment_mode': payment_mode,
-                            'dates': set()
-                        }
+                    current_atm_ref = find_unionbank_atm_ref(line)[0]
 
                     # Add the line to the current ATM reference group
-                    if line not in grouped_data[current_atm_ref]['raw_contents']:
+                    if line not in seen_lines[current_atm_ref]:
+                        seen_lines[current_atm_ref].add(line)
+                        group = grouped_data[current_atm_ref]
                         try:
                             # Find the amount at the end of the line (12 digits followed by 'DB')
-                            amount_match = re.search(r'(\d{12})(?:DB|LC)\d*\s*$', line)
-                            if amount_match:
-                                amount_str = amount_match.group(1)  # Get the first 12 digits
-                                amount = float(
-                                    amount_str) / 100  # Convert to float and divide by 100 for decimal points
-                                grouped_data[current_atm_ref]['total_amount'] += amount
-                                logger.debug(f"Added UNIONBANK amount {amount} to ATM ref {current_atm_ref}")
+                            amount_str = find_unionbank_amount_digits(line)
+                            if amount_str:
+                                amount_cents = int(amount_str)
+                                amount = amount_cents / 100  # Divide by 100 for decimal points
+                                group_cents[current_atm_ref] += amount_cents
+                                logger.debug("Added UNIONBANK amount %s to ATM ref %s", amount, current_atm_ref)
                             else:
                                 amount = 0.0
 
                             # Extract date that appears after UB followed by digits
-                            date_match = re.search(r'UB\d+\s+(\d{6})', line)
+                            date_match = UNIONBANK_DATE_PATTERN.search(line)
                             if date_match:
                                 date_str = date_match.group(1)
-                                formatted_date = f"{date_str[:2]}/{date_str[2:4]}/{date_str[4:]}"
-                                grouped_data[current_atm_ref]['dates'].add(f"UNIONBANK: {formatted_date}")
-                                logger.debug(f"Added UNIONBANK date {formatted_date} to ATM ref {current_atm_ref}")
+                                formatted_date = format_slash_date(date_str)
+                                group['dates'].add(f"UNIONBANK: {formatted_date}")
+                                logger.debug("Added UNIONBANK date %s to ATM ref %s", formatted_date, current_atm_ref)
 
                             # Add the line to raw_contents
-                            grouped_data[current_atm_ref]['raw_contents'].append(line)
-                            grouped_data[current_atm_ref]['transaction_count'] += 1
+                            group['raw_contents'].append(line)
+                            group['transaction_count'] += 1
                         except (ValueError, IndexError) as e:
                             logger.warning(f"Could not detect UNIONBANK amount in line: {line}")
                             # Still add the line even if amount detection fails
-                            grouped_data[current_atm_ref]['raw_contents'].append(line)
-                            grouped_data[current_atm_ref]['transaction_count'] += 1
+                            group['raw_contents'].append(line)
+                            group['transaction_count'] += 1
 
                 # If we have a current ATM reference but this line doesn't contain one,
                 # it's probably related to the current transaction
                 elif current_atm_ref and current_atm_ref in grouped_data:
                     # Add the line to the current ATM reference group
-                    if line not in grouped_data[current_atm_ref]['raw_contents']:
+                    if line not in seen_lines[current_atm_ref]:
+                        seen_lines[current_atm_ref].add(line)
                         grouped_data[current_atm_ref]['raw_contents'].append(line)
 
                 # If we don't have a current ATM reference, create a default group
                 else:
-                    if 'NOREF' not in grouped_data:
-                        grouped_data['NOREF'] = {
-                            'raw_contents': [],
-                            'transaction_count': 0,
-                            'total_amount': 0.0,
-                            'payment_mode': payment_mode,
-                            'dates': set()
-                        }
-                    if line not in grouped_data['NOREF']['raw_contents']:
+                    if line not in seen_lines['NOREF']:
+                        seen_lines['NOREF'].add(line)
                         grouped_data['NOREF']['raw_contents'].append(line)
 
+            for atm_ref, cents in group_cents.items():
+                grouped_data[atm_ref]['total_amount'] = cents / 100
+
         elif payment_mode == 'SM':
             # SM specific processing
             logger.debug("Starting SM file processing")
-            total_sm_amount = 0.0  # Initialize total amount counter
+            total_sm_cents = 0  # Amounts are whole cents, so total them as integers to keep the sum exact
             for line in lines:
-                if not line.strip():
-                    continue
-
                 raw_contents.append(line)
-                logger.debug(f"Processing SM line: {line}")
+                logger.debug("Processing SM line: %s", line)
                 
                 # For SM, extract ATM reference from position 18:31 (0-based)
                 if len(line) >= 45:  # Ensure line is long enough
                     atm_ref = line[18:31]  # Extract ATM reference
                     first_four = atm_ref[:4]  # Get first 4 digits for grouping
-                    logger.debug(f"Extracted ATM ref: {atm_ref}, First four: {first_four}")
-                    
-                    if first_four not in grouped_data:
-                        logger.debug(f"Creating new group for first four: {first_four}")
-                        grouped_data[first_four] = {
-                            'raw_contents': [],
-                            'transaction_count': 0,
-                            'total_amount': 0.0,
-                            'payment_mode': payment_mode,
-                            'dates': set(),
-                            'atm_refs': set()  # Store all ATM refs for this group
-                        }
+                    logger.debug("Extracted ATM ref: %s, First four: %s", atm_ref, first_four)
                     
                     # Add the ATM ref to the set of refs for this group
-                    grouped_data[first_four]['atm_refs'].add(atm_ref)
+                    group = grouped_data[first_four]
+                    group['atm_refs'].add(atm_ref)
                     
                     # Add the line to raw_contents
-                    grouped_data[first_four]['raw_contents'].append(line)
-                    grouped_data[first_four]['transaction_count'] += 1
+                    group['raw_contents'].append(line)
+                    group['transaction_count'] += 1
                     
                     # Extract amount (digits before 'CS')
+                    amount = 0
                     cs_pos = line.find('CS')
                     if cs_pos > 0:
                         # Look backwards from CS to find the amount
                         # The amount is typically 5-7 digits before CS
-                        amount_str = ''
-                        for i in range(cs_pos - 1, max(0, cs_pos - 10), -1):
-                            if line[i].isdigit():
-                                amount_str = line[i] + amount_str
-                            else:
-                                break
+                        start, end = find_sm_amount_offsets(line, cs_pos)
+                        amount_str = line[start:end]
                         
                         if amount_str:
-                            amount = float(amount_str) / 100  # Convert to float and divide by 100
-                            total_sm_amount += amount  # Add to total SM amount
-                            logger.debug(f"Found SM amount: {amount} from {amount_str}")
+                            amount_cents = int(amount_str)
+                            amount = amount_cents / 100  # Divide by 100 for decimal points
+                            total_sm_cents += amount_cents  # Add to total SM amount
+                            logger.debug("Found SM amount: %s from %s", amount, amount_str)
                         else:
-                            logger.debug(f"No valid amount found in line: {line}")
+                            logger.debug("No valid amount found in line: %s", line)
                     else:
-                        logger.debug(f"No 'CS' found in line: {line}")
+                        logger.debug("No 'CS' found in line: %s", line)
+                    group['amounts'].append(amount)
                     
                     # Extract date (from position 3-11 for MMDDYYYY format)
                     if len(line) >= 11:  # Ensure line is long enough
                         date_str = line[3:11]  # Extract date from positions 3-11
                         if date_str:
                             # Format the date from MMDDYYYY to MM/DD/YYYY
-                            formatted_date = f"{date_str[:2]}/{date_str[2:4]}/{date_str[4:]}"
-                            grouped_data[first_four]['dates'].add(f"SM: {formatted_date}")
-                            logger.debug(f"Added date {formatted_date} to ATM ref {first_four}")
+                            formatted_date = format_slash_date(date_str)
+                            group['dates'].add(f"SM: {formatted_date}")
+                            logger.debug("Added date %s to ATM ref %s", formatted_date, first_four)
                 else:
-                    logger.debug(f"Line too short for SM processing: {line}")
+                    logger.debug("Line too short for SM processing: %s", line)
+
+            total_sm_amount = total_sm_cents / 100
 
             # Store the total amount in the results
+            grouped_data.default_factory = None
             results = {
                 'grouped_data': grouped_data,
                 'raw_contents': raw_contents,
                 'payment_mode': payment_mode,
+                'separator': display_separator(payment_mode, grouped_data),
                 'total_amount': total_sm_amount
             }
             logger.info(f"Total SM amount: {total_sm_amount}")
@@ -1840,15 +1510,13 @@ def process_file_content(content, filename):
             logger.info(
                 f"ATM {atm_ref}: {data['transaction_count']} transactions, total amount: {data['total_amount']}")
 
-        # Convert dates set to sorted list for each ATM ref
-        for atm_ref in grouped_data:
-            if 'dates' in grouped_data[atm_ref]:
-                grouped_data[atm_ref]['dates'] = sorted(list(grouped_data[atm_ref]['dates']))
-
+        # Lookups of missing ATM references raise KeyError again once processing is done
+        grouped_data.default_factory = None
         return {
             'grouped_data': grouped_data,
             'raw_contents': raw_contents,
-            'payment_mode': payment_mode
+            'payment_mode': payment_mode,
+            'separator': display_separator(payment_mode, grouped_data)
         }
 
     except Exception as e:
@@ -1959,10 +1627,26 @@ def generate_split_files(grouped_data, output_dir, payment_mode):
         return False
 
 
+def get_local_ip():
+    """Return this computer's outbound IP address without resolving its hostname"""
+    # Connecting a UDP socket sends nothing, the kernel only picks the route and source address,
+    # whereas gethostbyname(gethostname()) can block on DNS for seconds on a misconfigured host
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        try:
+            s.connect(('10.255.255.255', 1))
+            return s.getsockname()[0]
+        except OSError:
+            return '127.0.0.1'
+
+
 if __name__ == '__main__':
+    # Disable signal handling that might cause abortions, only for the standalone server
+    # so that gunicorn keeps its own worker signal handlers
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
     # Get your computer's IP address
-    hostname = socket.gethostname()
-    local_ip = socket.gethostbyname(hostname)
+    local_ip = get_local_ip()
     print(f"\nAccess the application from other computers using:")
     print(f"http://{local_ip}:5000")
     print(f"\nMake sure your firewall allows connections on port 5000")
@@ -1971,8 +1655,9 @@ if __name__ == '__main__':
     print(f"Static folder exists: {os.path.exists(static_folder)}")
     print(f"Index.html exists: {os.path.exists(os.path.join(static_folder, 'index.html'))}")
 
-    # Create a custom server with increased timeout and thread support
-    server = make_server('0.0.0.0', 5000, app)
+    # Create a custom server with increased timeout and thread support, a thread per request
+    # keeps a long upload or report download from blocking status polls from other clients
+    server = make_server('0.0.0.0', 5000, app, threaded=True)
     server.timeout = 1800  # 30 minutes timeout
 
     # Set server options to handle large files
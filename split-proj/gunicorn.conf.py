@@ -0,0 +1,15 @@
+# Gunicorn settings for serving the app: gunicorn -c gunicorn.conf.py wsgi:app
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+
+# Processing status and results live in memory, so every request has to reach the
+# same process. A single worker with threads keeps polling consistent while parsing
+# still runs on all cores through the app's process pool.
+workers = 1
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+
+# Large uploads and report downloads can take a while
+timeout = 1800
+graceful_timeout = 30
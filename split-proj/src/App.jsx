@@ -184,7 +184,6 @@ function App() {
 
       const requestData = {
         processed_data: processedData,
-        raw_contents: rawContents,
         separator: separator,
         original_filename: baseFileName
       };